@@ -1,11 +1,14 @@
 import math
 import datetime
 
+import numpy as np
+
 # Sun elevation angle (SEA)
 
 # latitude & longitude are floats
 # utc_offset is int
 # this function gives you the sun angle based on a given hour and minute
+# hour & minute can also be numpy arrays to get many angles at once
 
 
 def getSEA(latitude, longitude, utc_offset, hour, minute, day_of_year):
@@ -14,33 +17,26 @@ def getSEA(latitude, longitude, utc_offset, hour, minute, day_of_year):
 
     g = (360 / 365.25) * (day_of_year + hour_minute / 24)
 
-    g_radians = math.radians(g)
+    g_radians = np.radians(g)
 
-    declination = 0.396372 - 22.91327 * math.cos(g_radians) + 4.02543 * math.sin(g_radians) - 0.387205 * math.cos(
-        2 * g_radians) + 0.051967 * math.sin(2 * g_radians) - 0.154527 * math.cos(3 * g_radians) + 0.084798 * math.sin(
+    declination = 0.396372 - 22.91327 * np.cos(g_radians) + 4.02543 * np.sin(g_radians) - 0.387205 * np.cos(
+        2 * g_radians) + 0.051967 * np.sin(2 * g_radians) - 0.154527 * np.cos(3 * g_radians) + 0.084798 * np.sin(
         3 * g_radians)
 
-    time_correction = 0.004297 + 0.107029 * math.cos(g_radians) - 1.837877 * math.sin(g_radians) - 0.837378 * math.cos(
-        2 * g_radians) - 2.340475 * math.sin(2 * g_radians)
+    time_correction = 0.004297 + 0.107029 * np.cos(g_radians) - 1.837877 * np.sin(g_radians) - 0.837378 * np.cos(
+        2 * g_radians) - 2.340475 * np.sin(2 * g_radians)
 
     SHA = (hour_minute - 12) * 15 + longitude + time_correction
 
-    if (SHA > 180):
-        SHA_corrected = SHA - 360
-    elif (SHA < -180):
-        SHA_corrected = SHA + 360
-    else:
-        SHA_corrected = SHA
-
     lat_radians = math.radians(latitude)
-    d_radians = math.radians(declination)
-    SHA_radians = math.radians(SHA)
+    d_radians = np.radians(declination)
+    SHA_radians = np.radians(SHA)
 
-    SZA_radians = math.acos(
-        math.sin(lat_radians) * math.sin(d_radians) + math.cos(lat_radians) * math.cos(d_radians) * math.cos(
+    SZA_radians = np.arccos(
+        math.sin(lat_radians) * np.sin(d_radians) + math.cos(lat_radians) * np.cos(d_radians) * np.cos(
             SHA_radians))
 
-    SZA = math.degrees(SZA_radians)
+    SZA = np.degrees(SZA_radians)
 
     SEA = 90 - SZA
 
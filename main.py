@@ -1,28 +1,73 @@
-from datetime import datetime
-
-import ephem
-import humanize
-import plotly.graph_objects as go
-import pytz
-import requests
-from discord_webhook import DiscordEmbed, DiscordWebhook  # Connect to discord
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
 from environs import Env  # For environment variables
 
 from SimplePythonSunPositionCalculator import getSEA
 
 
+# Meeus, Astronomical Algorithms, chapter 27
+# mean equinox/solstice polynomials for the years 2000-3000 (table 27.B)
+EQUINOX_SOLSTICE_TERMS = [
+    ((2451623.80984, 365242.37404, 0.05169, -0.00411, -0.00057), "Equinox"),   # March
+    ((2451716.56767, 365241.62603, 0.00325, 0.00888, -0.00030), "Solstice"),   # June
+    ((2451810.21715, 365242.01767, -0.11575, 0.00337, 0.00078), "Equinox"),    # September
+    ((2451900.05952, 365242.74049, -0.06223, -0.00823, 0.00032), "Solstice"),  # December
+]
+
+# periodic terms (A, B, C) used to correct the mean date (table 27.C)
+EQUINOX_SOLSTICE_PERIODIC = [
+    (485, 324.96, 1934.136), (203, 337.23, 32964.467), (199, 342.08, 20.186),
+    (182, 27.85, 445267.112), (156, 73.14, 45036.886), (136, 171.52, 22518.443),
+    (77, 222.54, 65928.934), (74, 296.72, 3034.906), (70, 243.58, 9037.513),
+    (58, 119.81, 33718.147), (52, 297.17, 150.678), (50, 21.02, 2281.226),
+    (45, 247.54, 29929.562), (44, 325.15, 31555.956), (29, 60.93, 4443.417),
+    (18, 155.12, 67555.328), (17, 288.79, 4562.452), (16, 198.04, 62894.029),
+    (14, 199.76, 31436.921), (12, 95.39, 14577.848), (12, 287.11, 31931.756),
+    (12, 320.81, 34777.259), (9, 227.73, 1222.114), (8, 15.45, 16859.074),
+]
+
+
+def equinox_solstice_dates(year):
+    # returns the four equinoxes and solstices of a year as (utc datetime, name)
+    y = (year - 2000) / 1000
+    events = []
+
+    for coefficients, name in EQUINOX_SOLSTICE_TERMS:
+        jde0 = sum(c * y ** i for i, c in enumerate(coefficients))
+
+        t = (jde0 - 2451545.0) / 36525
+        w = math.radians(35999.373 * t - 2.47)
+        delta_lambda = 1 + 0.0334 * math.cos(w) + 0.0007 * math.cos(2 * w)
+        s = sum(a * math.cos(math.radians(b + c * t))
+                for a, b, c in EQUINOX_SOLSTICE_PERIODIC)
+
+        jde = jde0 + 0.00001 * s / delta_lambda
+
+        # julian day 2451545.0 is 2000-01-01 12:00
+        # the difference between dynamical time and utc is about a minute so it is ignored
+        events.append((datetime(2000, 1, 1, 12) + timedelta(days=jde - 2451545.0), name))
+
+    return events
+
+
 def get_next_equinox_or_solstice(lat, long):
-    # create an observer object for your location
-    observer = ephem.Observer()
-    observer.lat = lat
-    observer.lon = long
+    # equinoxes and solstices are the same everywhere on earth
+    # so lat and long are not needed but kept so callers don't change
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-    # get the next equinox and solstice
-    next_equinox = (ephem.next_equinox(observer.date).datetime(), "Equinox")
-    next_solstice = (ephem.next_solstice(observer.date).datetime(), "Solstice")
+    # only looks at next year once this year's december solstice has passed
+    events = [i for i in equinox_solstice_dates(now.year) if i[0] > now]
+    if not events:
+        events = equinox_solstice_dates(now.year + 1)
 
     # find which one is closer
-    next_event = min([next_equinox, next_solstice], key=lambda x: x[0])
+    next_event = min(events, key=lambda x: x[0])
 
     # calculate and return the time until then
     return next_event
@@ -32,6 +77,9 @@ def get_next_equinox_or_solstice(lat, long):
 env = Env()
 env.read_env()  # read .env file, if it exists
 
+# every time in the graph and embed is shown in US Eastern
+EASTERN = ZoneInfo('US/Eastern')
+
 
 def format_td(x):
     # convert timedelta to seconds
@@ -53,27 +101,60 @@ def iso_to_datetime_str(x):
     # takes a isoformat string
     # then turns it into datetime object
     y = datetime.fromisoformat(x)
-    z = y.astimezone(pytz.timezone('US/Eastern'))
+    z = y.astimezone(EASTERN)
     return z.strftime("%H:%M")
 
 
-lat = float(env("LATITUDE"))
-long = float(env("LONGITUDE"))
-data = requests.get(
-    F"https://api.sunrise-sunset.org/json?lat={lat}&lng={long}&formatted=0").json()['results']
+def get_sun_data(lat, long, now):
+    # the api gives the same answer all day for a location
+    # so the response is saved to disk and reused on later runs that day
+    today = now.strftime("%Y-%m-%d")
+    cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "solarcalc")
+    cache_file = os.path.join(cache_dir, f"{lat}_{long}_{today}.json")
 
-astronomical_twilight_begin = iso_to_datetime_str(
-    data['astronomical_twilight_begin'])
-sunrise = iso_to_datetime_str(data['sunrise'])
-solar_noon = iso_to_datetime_str(data['solar_noon'])
-sunset = iso_to_datetime_str(data['sunset'])
-astronomical_twilight_end = iso_to_datetime_str(
-    data['astronomical_twilight_end'])
+    # a broken cache file is treated like a missing one and fetched again
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file) as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            pass
 
+    import httpx
+
+    # the date is sent so the answer is for the same day the cache file is named after
+    with httpx.Client(http2=True, timeout=5, follow_redirects=True) as client:
+        response = client.get(
+            F"https://api.sunrise-sunset.org/json?lat={lat}&lng={long}&date={today}&formatted=0")
+        response.raise_for_status()
+        response = response.json()
+
+    # error responses are never cached so the next run tries again
+    if response['status'] != "OK":
+        raise RuntimeError(f"sunrise-sunset.org returned {response['status']}")
+    data = response['results']
+
+    # written to a temp file first so a half written file never ends up in the cache
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(cache_file + ".tmp", cache_file)
+
+    # only today's files are ever read so older ones are removed
+    for name in os.listdir(cache_dir):
+        if not name.endswith(f"_{today}.json"):
+            os.remove(os.path.join(cache_dir, name))
+
+    return data
+
+
+def embed_to_discord(lat, long, data, now):
+    # imported here so they are only loaded when something is actually sent
+    import humanize
+    from discord_webhook import DiscordEmbed, DiscordWebhook  # Connect to discord
 
-def embed_to_discord():
     # create embed object for webhook
-    today = datetime.now().astimezone(pytz.timezone('US/Eastern')).strftime("%Y %m %d")
+    today = now.strftime("%Y %m %d")
     embed = DiscordEmbed(title=f"Sun Position Today {today}", color="ffff00")
 
     embed.set_image(url='attachment://fig1.png')
@@ -90,104 +171,126 @@ def embed_to_discord():
     embed.set_footer(text='Made By Ibby With ❤️',
                      icon_url='https://avatars.githubusercontent.com/u/22484328?v=4')
 
-    # add embed object to webhook(s)
-    for url in env.list("WEBHOOKS"):
-        webhook = DiscordWebhook(url=url)
-
-        # image
-        with open("fig1.png", "rb") as f:
-            webhook.add_file(file=f.read(), filename='fig1.png')
+    # image is read once and shared by every webhook
+    with open("fig1.png", "rb") as f:
+        image = f.read()
 
+    def send(url):
+        webhook = DiscordWebhook(url=url)
+        webhook.add_file(file=image, filename='fig1.png')
         webhook.add_embed(embed)
-        webhook.execute()
-
-
-# list of angles and their respective times that they happen at
-sun_angle_list = []
-time_list = []
-
-# calculates the difference in hours between UTC and any timezone in this case US Eastern
-utc_offset = datetime.now(pytz.timezone('US/Eastern'))
-utc_offset = int(utc_offset.utcoffset().total_seconds()/3600)
-
-for h in range(24):
-    for m in range(0, 60):
-        angle = getSEA(lat, long, utc_offset, hour=h, minute=m,
-                       day_of_year=datetime.now().timetuple()[7])
-        sun_angle_list.append(angle)
-        time_list.append(f'{h:02}:{m:02}')
-
-
-fig = go.Figure(data=go.Scatter(
-    x=time_list, y=sun_angle_list, mode='lines'))
-
-# makes the background white
-fig.update_layout(paper_bgcolor='#fff',
-                  plot_bgcolor='#fff')
-
-# Labels
-fig.update_layout(title={'text': 'Sun Elevation Angle With Astronomical Twilight & Solar Noon', 'x': 0.5, 'xanchor': 'center'},
-                  yaxis_zeroline=True,
-                  xaxis_zeroline=True,
-                  xaxis_title="Time",
-                  yaxis_title="Angle (in Degrees)")
-
-# takes the five important variables and finds their angles by finding the index at which the angles occur
-five_variables_time = [astronomical_twilight_begin, sunrise,
-                       solar_noon, sunset, astronomical_twilight_end]
-five_variables_index = [time_list.index(i) for i in five_variables_time]
-five_variables_angles = [sun_angle_list[i] for i in five_variables_index]
-
-# Annotates the five important times on the graph
-# the plus 3 is so that the text does not go through the lines
-fig.add_trace(go.Scatter(
-    x=five_variables_time,
-    y=[i + 4 for i in five_variables_angles],
-    mode="text",
-    text=five_variables_time,
-    textfont=dict(
-        size=15,
-        color="black"
-    )
-))
-
-# I don't want to show every 15 minute interval because it gets messy
-fig.update_xaxes(nticks=12)
-
-# Hides the legend because it includes extraneous information
-fig.update_layout(showlegend=False)
-
-# fills in the daytime to be slightly yellow
-fig.add_trace(go.Scatter(
-              x=[time_list[i] for i in range(
-                  five_variables_index[1], five_variables_index[3] + 1)],
-              y=[sun_angle_list[i] for i in range(
-                  five_variables_index[1], five_variables_index[3] + 1)],
-              fill='tozeroy',
-              fillcolor="rgba(255, 255, 51, 0.1)",
-              mode='none'
-              ))
-
-# these two fills in both before and after daylight to be slightly dark
-# this is for midnight to sunrise
-fig.add_trace(go.Scatter(
-              x=[time_list[i] for i in range(0, five_variables_index[1] + 1)],
-              y=[sun_angle_list[i]
-                  for i in range(0, five_variables_index[1] + 1)],
-              fill='tozeroy',
-              fillcolor='rgba(0, 0, 51, 0.1)',
-              mode='none'
-              ))
-# this is for sunset to midnight
-fig.add_trace(go.Scatter(
-              x=[time_list[i] for i in range(
-                  five_variables_index[3], len(time_list))],
-              y=[sun_angle_list[i]
-                  for i in range(five_variables_index[3], len(time_list))],
-              fill='tozeroy',
-              fillcolor='rgba(0, 0, 51, 0.1)',
-              mode='none'
-              ))
-
-fig.write_image("fig1.png", width=1920, height=1080)
-embed_to_discord()
+        return webhook.execute()
+
+    # add embed object to webhook(s) and send them all at the same time
+    urls = env.list("WEBHOOKS")
+    with ThreadPoolExecutor(max_workers=len(urls) or 1) as executor:
+        futures = [executor.submit(send, url) for url in urls]
+        for future in as_completed(futures):
+            future.result()
+
+
+def build_figure(lat, long, data, now):
+    # plotly takes a while to import so it is only loaded when the figure is made
+    import plotly.graph_objects as go
+
+    # calculates the difference in hours between UTC and any timezone in this case US Eastern
+    utc_offset = int(now.utcoffset().total_seconds()/3600)
+    day_of_year = now.timetuple().tm_yday
+
+    # every minute of the day as hour and minute arrays
+    hours = np.arange(24).repeat(60)
+    minutes = np.tile(np.arange(60), 24)
+
+    # list of angles and their respective times (in minutes since midnight) that they happen at
+    sun_angle_list = getSEA(lat, long, utc_offset, hour=hours, minute=minutes,
+                            day_of_year=day_of_year)
+    time_list = hours * 60 + minutes
+
+    fig = go.Figure(data=go.Scattergl(
+        x=time_list, y=sun_angle_list, mode='lines'))
+
+    # makes the background white
+    fig.update_layout(paper_bgcolor='#fff',
+                      plot_bgcolor='#fff')
+
+    # Labels
+    fig.update_layout(title={'text': 'Sun Elevation Angle With Astronomical Twilight & Solar Noon', 'x': 0.5, 'xanchor': 'center'},
+                      yaxis_zeroline=True,
+                      xaxis_zeroline=True,
+                      xaxis_title="Time",
+                      yaxis_title="Angle (in Degrees)")
+
+    # takes the five important variables and finds their angles by finding the index at which the angles occur
+    five_variables_time = [iso_to_datetime_str(data[i]) for i in ['astronomical_twilight_begin', 'sunrise',
+                                                                  'solar_noon', 'sunset', 'astronomical_twilight_end']]
+    five_variables_index = np.array([int(i[:2]) * 60 + int(i[3:]) for i in five_variables_time])
+    five_variables_angles = sun_angle_list[five_variables_index]
+
+    # Annotates the five important times on the graph
+    # the plus 3 is so that the text does not go through the lines
+    fig.add_trace(go.Scatter(
+        x=five_variables_index,
+        y=five_variables_angles + 4,
+        mode="text",
+        text=five_variables_time,
+        textfont=dict(
+            size=15,
+            color="black"
+        )
+    ))
+
+    # I don't want to show every minute because it gets messy so only label every 2 hours
+    fig.update_layout(xaxis=dict(tickmode='array',
+                                 tickvals=np.arange(0, 1440, 120),
+                                 ticktext=[f'{h:02}:00' for h in range(0, 24, 2)]))
+
+    # Hides the legend because it includes extraneous information
+    fig.update_layout(showlegend=False)
+
+    # fills in the daytime to be slightly yellow
+    fig.add_trace(go.Scattergl(
+                  x=time_list[five_variables_index[1]:five_variables_index[3] + 1],
+                  y=sun_angle_list[five_variables_index[1]:five_variables_index[3] + 1],
+                  fill='tozeroy',
+                  fillcolor="rgba(255, 255, 51, 0.1)",
+                  mode='none'
+                  ))
+
+    # these two fills in both before and after daylight to be slightly dark
+    # they stay separate traces because webgl doesn't split a tozeroy fill at gaps
+    # this is for midnight to sunrise
+    fig.add_trace(go.Scattergl(
+                  x=time_list[0:five_variables_index[1] + 1],
+                  y=sun_angle_list[0:five_variables_index[1] + 1],
+                  fill='tozeroy',
+                  fillcolor='rgba(0, 0, 51, 0.1)',
+                  mode='none'
+                  ))
+    # this is for sunset to midnight
+    fig.add_trace(go.Scattergl(
+                  x=time_list[five_variables_index[3]:len(time_list)],
+                  y=sun_angle_list[five_variables_index[3]:len(time_list)],
+                  fill='tozeroy',
+                  fillcolor='rgba(0, 0, 51, 0.1)',
+                  mode='none'
+                  ))
+
+    return fig
+
+
+def main():
+    lat = float(env("LATITUDE"))
+    long = float(env("LONGITUDE"))
+
+    # the current time is looked up once so the cache, graph and embed all agree on the day
+    now = datetime.now(EASTERN)
+
+    data = get_sun_data(lat, long, now)
+
+    fig = build_figure(lat, long, data, now)
+    fig.write_image("fig1.png", width=1280, height=720, scale=1)
+    embed_to_discord(lat, long, data, now)
+
+
+if __name__ == '__main__':
+    main()